@@ -1,92 +1,125 @@
-from flask import Flask, render_template, jsonify, session
+from flask import Flask, Response, render_template, request, session
+from flask.sessions import SecureCookieSessionInterface
 import os
 from .state import (
-  # global variables
-  app_state,
-  usersdb,
-  # types
-  GameState,
-  UserState,
-  UserInfo,
   # locks
   USERS_LOCK,
-  STATE_LOCK,
-  # parameters
-  MINIMUM_PLAYERS,
+  # writers
+  add_user,
+  # snapshots
+  status_json,
+  players_json,
+  state_json,
+  # snapshot versioning
+  bump_generation,
+  generation,
+  wait_for_change,
 )
 
+# how long a `/state?since=<generation>` request may wait for a change
+LONG_POLL_TIMEOUT = 25
+# Convenience: add two fake users for quick local testing when the
+# environment variable `BINDOLO_FAKE_USERS=1` is set. This is temporary
+# and safe for development — it won't run unless you set the env var.
+FAKE_USERS = os.getenv("BINDOLO_FAKE_USERS") == "1"
+# usersdb is shared by every app created in this process: add them only once
+_fake_users_added = False
+
+
+class PollingSessionInterface(SecureCookieSessionInterface):
+  """Signed-cookie sessions, skipped for the polling endpoints.
+
+  Every open page hits those endpoints every few seconds and none of them
+  looks at the session, so they get a null session instead of having the
+  cookie decoded and its signature verified on each request.
+  """
+
+  sessionless_paths = frozenset({"/usersdb", "/players", "/state"})
+
+  def open_session(self, app, request):
+    if request.path in self.sessionless_paths:
+      return None
+    return super().open_session(app, request)
+
 
 def create_app(test_config=None):
   app = Flask(__name__, instance_relative_config=True)
   app.config.from_mapping(
     SECRET_KEY="dev-secret",
   )
+  app.session_interface = PollingSessionInterface()
   from .state import init as init_state
 
   init_state()
-  # Convenience: add two fake users for quick local testing when the
-  # environment variable `BINDOLO_FAKE_USERS=1` is set. This is temporary
-  # and safe for development — it won't run unless you set the env var.
-  if os.getenv("BINDOLO_FAKE_USERS") == "1":
-    with USERS_LOCK:
-      usersdb.setdefault("Antonietta", UserInfo())
-      usersdb.setdefault("Bromualdo", UserInfo())
+
+  # rendered pages that do not depend on the game state, per mount point
+  page_cache = {}
+
+  def cached_page(template):
+    key = (template, request.script_root)
+    page = page_cache.get(key)
+    if page is None:
+      page = render_template(template)
+      page_cache[key] = page
+    return page
+
+  global _fake_users_added
+  if FAKE_USERS and not _fake_users_added:
+    with USERS_LOCK.write():
+      add_user("Antonietta")
+      add_user("Bromualdo")
+      bump_generation()
+    _fake_users_added = True
 
   @app.route("/", methods=["GET"])
   def index():
     session.clear()
+
     # TODO: reset the session here
-    # pass the current mapping of stored usernames to the template
-    with USERS_LOCK:
-      current = {
-        k: {"state": v.state.value, "text": v.text} for k, v in usersdb.items()
-      }
-    with STATE_LOCK:
-      current_state = app_state.state.value
-    return render_template("index.html", usersdb=current, state=current_state)
+    # the page is only the registration form, it shows nothing of the game
+    return cached_page("index.html")
 
   @app.route("/usersdb", methods=["GET"])
   def get_users():
     # return simple status booleans used by the landing page polling JS
     # - `necessary_players`: true when we have at least the minimum number of players
-    # - `all_ready`: true when there is at least one user and every user is in the READY state
-    with USERS_LOCK:
-      total = len(usersdb)
-      necessary_players = total >= MINIMUM_PLAYERS
-      # the all ready might need to be tweaked a bit: I do not thing it is robust to rely only on ENTERING here
-      all_ready = total > 0 and all(
-        v.state is not UserState.ENTERING for v in usersdb.values()
-      )
-      return jsonify({"necessary_players": necessary_players, "all_ready": all_ready})
+    # - `all_ready`: true when there is at least one user and no user is still ENTERING
+    # the body is kept up to date by the writers, no need to lock here
+    return Response(status_json(), mimetype="application/json")
 
   @app.route("/players", methods=["GET"])
   def get_players():
     # return a simple mapping of username -> state (no text)
-    with USERS_LOCK:
-      return jsonify({"users": {k: v.state.value for k, v in usersdb.items()}})
+    return Response(players_json(), mimetype="application/json")
 
   @app.route("/state", methods=["GET"])
   def get_state():
-    with STATE_LOCK:
-      return jsonify(
-        {
-          "state": app_state.state.value,
-          "info": app_state.info or {},
-          "started": app_state.state != GameState.WAITING_FOR_NEW_PLAYERS,
-          "word": app_state.word,
-        }
-      )
+    # long-poll: a client passing back the generation it last saw (sent in the
+    # X-Bindolo-Generation header) is answered only once something changed, or
+    # after LONG_POLL_TIMEOUT seconds
+    since = request.args.get("since", type=int)
+    if since is not None:
+      wait_for_change(since, LONG_POLL_TIMEOUT)
+    gen = generation()
+    # the body is kept up to date by the writers, no need to lock here
+    return Response(
+      state_json(),
+      mimetype="application/json",
+      headers={"X-Bindolo-Generation": str(gen)},
+    )
 
   # @app.route("/clear", methods=["POST"])
   # def clear_users():
   #   # clear the in-memory storage
-  #   with USERS_LOCK:
+  #   with USERS_LOCK.write():
   #     usersdb.clear()
+  #     bump_generation()
   #   return redirect(url_for("index"))
 
   @app.route("/admin", methods=["GET"])
   def admin():
-    return render_template("admin.html")
+    # the page is static, all the data is polled by its JS
+    return cached_page("admin.html")
 
   # now loading the game logic
   from . import game
@@ -97,5 +130,3 @@ def create_app(test_config=None):
 
 
 app = create_app()
-if __name__ == "__main__":
-  app.run(debug=True)
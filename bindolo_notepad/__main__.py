@@ -0,0 +1,26 @@
+"""Serve the app without uwsgi: `python -m bindolo_notepad` or `bindolo`."""
+
+import os
+
+from . import app
+
+HOST = os.getenv("BINDOLO_HOST", "0.0.0.0")
+PORT = int(os.getenv("BINDOLO_PORT", "8000"))
+
+
+def main():
+  try:
+    from waitress import serve
+  except ImportError:
+    # fall back on the werkzeug server, threaded and without the debugger
+    # unless explicitly asked for
+    app.run(
+      host=HOST, port=PORT, threaded=True, debug=os.getenv("BINDOLO_DEBUG") == "1"
+    )
+  else:
+    # one process, many threads: see bindolo.ini
+    serve(app, host=HOST, port=PORT, threads=32)
+
+
+if __name__ == "__main__":
+  main()
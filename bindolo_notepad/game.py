@@ -7,25 +7,48 @@ from flask import (
   jsonify,
   session,
 )
+from functools import lru_cache
 import random
 from .state import (
   # global variables
   app_state,
   usersdb,
+  users_view,
   # types
   GameState,
   UserState,
-  UserInfo,
   # locks
   USERS_LOCK,
   STATE_LOCK,
   check_readiness,
+  add_user,
+  update_user,
+  users_in,
+  submitted_players,
+  bump_generation,
+  refresh_state_json,
 )
 
 
 bp = Blueprint("game", __name__, url_prefix="/game")
 
 
+@lru_cache(maxsize=16)
+def _route_url(endpoint, script_root):
+  # URLs of routes without arguments only change with the mount point
+  return url_for(endpoint)
+
+
+def _redirect_home():
+  return redirect(_route_url("index", request.script_root))
+
+
+def _payload():
+  """Return the request data as a mapping: the JSON object body, else the form."""
+  data = request.get_json(silent=True)
+  return data if isinstance(data, dict) else request.form
+
+
 @bp.route("/", methods=["POST", "GET"])
 def landing():
   reason = None
@@ -34,40 +57,37 @@ def landing():
   if request.method == "POST":
     username = request.form.get("username", "").strip()
     if not username:
-      return redirect(url_for("index"))
+      return _redirect_home()
 
-    # Only allow new users while the app is waiting for players
-    with STATE_LOCK:
-      current_state = app_state.state
+    # Only allow new users while the app is waiting for players; checked under
+    # USERS_LOCK so that the game cannot start between the check and the join
+    with USERS_LOCK.write():
+      with STATE_LOCK.read():
+        accepted = app_state.state is GameState.WAITING_FOR_NEW_PLAYERS
+      # register user in-memory
+      if accepted and username not in usersdb:
+        add_user(username)
+        bump_generation()
 
-    if current_state is not GameState.WAITING_FOR_NEW_PLAYERS:
+    if accepted:
+      # persist username in session so subsequent pages know which user this is
+      session["username"] = username
+    else:
       # registration closed — show informative landing with rejection
-      accepted = False
       reason = (
         "La partita è già iniziata. Non si possono più aggiungere nuovi giocatori."
       )
-    else:
-      accepted = True
-      # register user in-memory
-      with USERS_LOCK:
-        info = usersdb.get(username)
-        if info is None:
-          info = UserInfo()
-          usersdb[username] = info
-
-        # persist username in session so subsequent pages know which user this is
-        session["username"] = username
   else:
     # If the user has a session username, show the landing view for them.
     username = session.get("username")
     if not username:
-      return redirect(url_for("index"))
+      return _redirect_home()
 
-    with USERS_LOCK:
-      info = usersdb.get(username)
-      if info is None:
-        return redirect(url_for("index"))
-    user_state = info.state.value
+    with USERS_LOCK.read():
+      view = users_view.get(username)
+      if view is None:
+        return _redirect_home()
+    user_state = view["state"]
     accepted = True
   return render_template(
     "game/landing.html",
@@ -81,24 +101,23 @@ def landing():
 @bp.route("/user/ready", methods=["POST"])
 def set_user_ready():
   # Accept JSON or form data with `username`
-  data = request.get_json(silent=True) or request.form
-  username = data.get("username") if hasattr(data, "get") else None
+  username = _payload().get("username")
   if not username:
     return jsonify({"error": "username is required"}), 400
 
-  with USERS_LOCK:
+  with USERS_LOCK.write():
     user = usersdb.get(username)
     if user is None:
       return jsonify({"error": "user not found"}), 404
-    user.state = UserState.READY
-  check_readiness()
-  # return the new state and whether the game has started
-  with STATE_LOCK:
-    started_flag = app_state.state != GameState.WAITING_FOR_NEW_PLAYERS
+    update_user(username, state=UserState.READY)
+    check_readiness()
+    bump_generation()
+    state_value = user.state.value
+    # return the new state and whether the game has started
+    with STATE_LOCK.read():
+      started_flag = app_state.state != GameState.WAITING_FOR_NEW_PLAYERS
 
-  return jsonify(
-    {"username": username, "state": user.state.value, "started": started_flag}
-  )
+  return jsonify({"username": username, "state": state_value, "started": started_flag})
 
 
 @bp.route("/play", methods=["GET"])
@@ -107,10 +126,10 @@ def play():
   username = session.get("username")
   user_state = None
   if username:
-    with USERS_LOCK:
-      user = usersdb.get(username)
-      if user is not None:
-        user_state = user.state.value
+    with USERS_LOCK.read():
+      view = users_view.get(username)
+      if view is not None:
+        user_state = view["state"]
 
   return render_template("game/play.html", username=username, user_state=user_state)
 
@@ -121,29 +140,26 @@ def reading():
   # of player-submitted texts.
   username = session.get("username")
   user_state = None
-  with USERS_LOCK:
+  with USERS_LOCK.read():
     if username:
       user = usersdb.get(username)
       if user is not None:
-        user_state = user.state.value
+        user_state = user.state
 
     # collect player texts (exclude empty)
     player_texts = []
     # If the current session user is the reader, present player texts in a random order
-    if user_state == UserState.READER.value:
-      player_texts = [
-        {"text": u.text}
-        for _, u in usersdb.items()
-        if (u.text is not None and u.text != "")
-      ]
-      random.shuffle(player_texts)
-  with STATE_LOCK:
+    if user_state is UserState.READER:
+      player_texts = [{"text": v["text"]} for v in users_view.values() if v["text"]]
+  random.shuffle(player_texts)
+  with STATE_LOCK.read():
     word = app_state.word
 
   return render_template(
     "game/reading.html",
     username=username,
-    user_state=user_state,
+    # the template only needs the string form
+    user_state=user_state.value if user_state is not None else None,
     game_word=word,
     player_texts=player_texts,
   )
@@ -156,22 +172,21 @@ def reading_restart():
   if not username:
     return jsonify({"error": "not authenticated"}), 403
 
-  with USERS_LOCK:
+  with USERS_LOCK.write():
     user = usersdb.get(username)
     if user is None:
       return jsonify({"error": "user not found"}), 404
     if user.state is not UserState.READER:
       return jsonify({"error": "only the reader may restart the round"}), 403
 
-  # Reset global state and per-user states
-  with STATE_LOCK:
-    app_state.state = GameState.WAITING_FOR_PLAYERS
-    app_state.word = None
-
-  with USERS_LOCK:
-    for u in usersdb.values():
-      u.state = UserState.ENTERING
-      u.text = ""
+    # Reset global state and per-user states
+    with STATE_LOCK.write():
+      app_state.state = GameState.WAITING_FOR_PLAYERS
+      app_state.word = None
+      refresh_state_json()
+    for uname in usersdb:
+      update_user(uname, state=UserState.ENTERING, text="")
+    bump_generation()
 
   return jsonify({"ok": True})
 
@@ -192,57 +207,42 @@ def play_submit():
   if not username:
     return jsonify({"error": "not authenticated"}), 403
 
-  data = request.get_json(silent=True) or request.form
+  data = _payload()
 
-  with USERS_LOCK:
+  with USERS_LOCK.write():
     user = usersdb.get(username)
     if user is None:
       return jsonify({"error": "user not found"}), 404
-    role = user.state
-
-  # Handle by role
-  if role is UserState.PLAYER:
-    text = data.get("text") if hasattr(data, "get") else None
-    if text is None:
-      return jsonify({"error": "text is required for player submissions"}), 400
-    with USERS_LOCK:
-      user = usersdb.get(username)
-      user.text = str(text)
-    saved_value = user.text
-
-  elif role is UserState.READER:
-    word = data.get("word") if hasattr(data, "get") else None
-    text = data.get("text") if hasattr(data, "get") else None
-    if not word or not text:
-      return jsonify({"error": "word and text is required for reader submissions"}), 400
-    with USERS_LOCK:
-      user = usersdb.get(username)
-      user.text = str(text)
-      saved_value = user.text
-    with STATE_LOCK:
-      app_state.word = str(word or "")
 
-  else:
-    return jsonify({"error": "user not in a valid role for submissions"}), 400
-
-  # After saving, check whether all users have submitted
-  move_to_reading = False
-  with USERS_LOCK:
-    all_submitted = True
-    for u in usersdb.values():
-      if u.state is UserState.PLAYER:
-        if not (u.text and str(u.text).strip()):
-          all_submitted = False
-          break
-      elif u.state is UserState.READER:
-        with STATE_LOCK:
-          if not (app_state.word and str(app_state.word).strip()):
-            all_submitted = False
-            break
-    if all_submitted:
-      with STATE_LOCK:
+    # Handle by role
+    word = None
+    if user.state is UserState.PLAYER:
+      text = data.get("text")
+      if text is None:
+        return jsonify({"error": "text is required for player submissions"}), 400
+    elif user.state is UserState.READER:
+      word = data.get("word")
+      text = data.get("text")
+      if not word or not text:
+        return jsonify(
+          {"error": "word and text is required for reader submissions"}
+        ), 400
+    else:
+      return jsonify({"error": "user not in a valid role for submissions"}), 400
+    saved_value = update_user(username, text=str(text)).text
+
+    # After saving, check whether all users have submitted
+    with STATE_LOCK.write():
+      if word is not None:
+        app_state.word = str(word)
+      word_ok = bool(app_state.word and app_state.word.strip())
+      move_to_reading = submitted_players() == users_in(UserState.PLAYER) and (
+        word_ok or not users_in(UserState.READER)
+      )
+      if move_to_reading:
         app_state.state = GameState.GAME_WAITING_FOR_DECISION_IRL
-      move_to_reading = True
+      refresh_state_json()
+    bump_generation()
 
   return jsonify(
     {
@@ -1,7 +1,11 @@
-from threading import Lock
+from threading import Condition, Lock
+from collections import deque
+from contextlib import contextmanager
 from enum import Enum
 from dataclasses import dataclass
-from typing import Dict, Any
+from typing import Dict, Any, Callable, Iterator
+
+import orjson
 
 MINIMUM_PLAYERS = 3  # minimum number of players required to start the game
 
@@ -13,12 +17,19 @@ class UserState(Enum):
   READER = "reader"
 
 
-@dataclass
+# string form of each UserState, to skip the `.value` descriptor when the
+# writers refresh `users_view`
+_USER_STATE_VALUE = {s: s.value for s in UserState}
+
+
+@dataclass(slots=True)
 class UserInfo:
   """In-memory info stored per user while the server runs."""
 
   state: UserState = UserState.ENTERING
   text: str = ""
+  # whether `text` has any non-blank character, set together with it
+  has_text: bool = False
 
 
 class GameState(Enum):
@@ -28,61 +39,275 @@ class GameState(Enum):
   GAME_WAITING_FOR_DECISION_IRL = "game_waiting_for_decision_irl"
 
 
-@dataclass
+class RWLock:
+  """Readers-writer lock: any number of readers or a single writer.
+
+  Waiting writers block new readers, so a steady stream of polling requests
+  cannot starve the endpoints that mutate the state. Not re-entrant.
+  """
+
+  def __init__(self) -> None:
+    self._cond = Condition(Lock())
+    self._readers = 0
+    self._writer = False
+    self._writers_waiting = 0
+
+  @contextmanager
+  def read(self) -> Iterator[None]:
+    with self._cond:
+      while self._writer or self._writers_waiting:
+        self._cond.wait()
+      self._readers += 1
+    try:
+      yield
+    finally:
+      with self._cond:
+        self._readers -= 1
+        if self._readers == 0:
+          self._cond.notify_all()
+
+  @contextmanager
+  def write(self) -> Iterator[None]:
+    with self._cond:
+      self._writers_waiting += 1
+      while self._writer or self._readers:
+        self._cond.wait()
+      self._writers_waiting -= 1
+      self._writer = True
+    try:
+      yield
+    finally:
+      with self._cond:
+        self._writer = False
+        self._cond.notify_all()
+
+
+@dataclass(slots=True)
 class AppState:
   """Global application state held in-memory while the process runs."""
 
   state: GameState = GameState.WAITING_FOR_NEW_PLAYERS
   info: Dict[str, Any] | None = None
   word: str | None = None
-  # rotation order for selecting the reader and next index
-  reader_order: list[str] | None = None
-  reader_idx: int = 0
+  # rotation order for selecting the reader: the next reader is at the front
+  reader_order: deque[str] | None = None
 
 
+# when both locks are needed, always take USERS_LOCK first, then STATE_LOCK
 usersdb: Dict[str, UserInfo] = {}
-USERS_LOCK = Lock()
+USERS_LOCK = RWLock()
 app_state = AppState()
-STATE_LOCK = Lock()
+STATE_LOCK = RWLock()
+
+# `/state` body for app_state, swapped in by refresh_state_json() which every
+# writer of app_state calls (with STATE_LOCK held for writing) after changing
+# it; the bodies of the common case, no word and no info, are built up front
+_STATE_JSON = {
+  g: orjson.dumps(
+    {
+      "state": g.value,
+      "info": {},
+      "started": g is not GameState.WAITING_FOR_NEW_PLAYERS,
+      "word": None,
+    }
+  )
+  for g in GameState
+}
+_state_json = _STATE_JSON[app_state.state]
+
+
+def refresh_state_json() -> None:
+  global _state_json
+  if app_state.word is None and not app_state.info:
+    _state_json = _STATE_JSON[app_state.state]
+  else:
+    _state_json = orjson.dumps(
+      {
+        "state": app_state.state.value,
+        "info": app_state.info or {},
+        "started": app_state.state is not GameState.WAITING_FOR_NEW_PLAYERS,
+        "word": app_state.word,
+      }
+    )
+
+
+def state_json() -> bytes:
+  return _state_json
+
+
+# bumped by every writer of `usersdb` or `app_state`, so that readers can tell
+# whether a snapshot they built earlier is still current
+_generation = 0
+_GENERATION_CHANGED = Condition()
+
+
+def bump_generation() -> None:
+  global _generation
+  with _GENERATION_CHANGED:
+    _generation += 1
+    _GENERATION_CHANGED.notify_all()
+
+
+def generation() -> int:
+  return _generation
+
+
+def wait_for_change(since: int, timeout: float) -> int:
+  """Block until the generation differs from `since` or `timeout` expires."""
+  with _GENERATION_CHANGED:
+    _GENERATION_CHANGED.wait_for(lambda: _generation != since, timeout)
+    return _generation
+
+
+# plain-value mirror of `usersdb` ({username: {"state": str, "text": str}}) that
+# the readers can copy instead of rebuilding it from the dataclasses; the
+# entries are replaced, never mutated, so a shallow copy is a stable snapshot.
+# Always go through the helpers below, with USERS_LOCK held for writing.
+users_view: Dict[str, Dict[str, str]] = {}
+# how many users are in each state, and how many players have submitted a
+# text, so the readiness checks do not have to scan `usersdb`
+_state_counts: Dict[UserState, int] = {s: 0 for s in UserState}
+_submitted_players = 0
+
+
+def _has_submitted(info: UserInfo) -> bool:
+  return info.state is UserState.PLAYER and info.has_text
+
 
+# `/usersdb` body for each (necessary_players, all_ready) pair; the current one
+# is swapped in by the helpers below with a single assignment, so the endpoint
+# can serve it without taking USERS_LOCK
+_STATUS_JSON = {
+  (n, a): orjson.dumps({"necessary_players": n, "all_ready": a})
+  for n in (False, True)
+  for a in (False, True)
+}
+_status_json = _STATUS_JSON[(False, False)]
 
-def check_readiness():
-  with USERS_LOCK:
-    total = len(usersdb)
-    necessary_players = total >= MINIMUM_PLAYERS
-    all_ready = total > 0 and all(v.state is UserState.READY for v in usersdb.values())
+
+def _refresh_status() -> None:
+  global _status_json
+  total = len(usersdb)
+  _status_json = _STATUS_JSON[
+    (total >= MINIMUM_PLAYERS, total > 0 and _state_counts[UserState.ENTERING] == 0)
+  ]
+
+
+def status_json() -> bytes:
+  return _status_json
+
+
+# `/players` body, dropped by the helpers below and rebuilt by the next reader
+_players_json: bytes | None = None
+
+
+def players_json() -> bytes:
+  global _players_json
+  body = _players_json
+  if body is not None:
+    return body
+  with USERS_LOCK.read():
+    body = _players_json
+    if body is None:
+      body = orjson.dumps({"users": {k: v["state"] for k, v in users_view.items()}})
+      _players_json = body
+  return body
+
+
+def users_in(state: UserState) -> int:
+  return _state_counts[state]
+
+
+def submitted_players() -> int:
+  return _submitted_players
+
+
+def add_user(username: str) -> UserInfo:
+  global _players_json
+  info = usersdb.get(username)
+  if info is None:
+    info = UserInfo()
+    usersdb[username] = info
+    users_view[username] = {"state": _USER_STATE_VALUE[info.state], "text": info.text}
+    _state_counts[info.state] += 1
+    _refresh_status()
+    _players_json = None
+  return info
+
+
+def update_user(
+  username: str, state: UserState | None = None, text: str | None = None
+) -> UserInfo:
+  global _submitted_players, _players_json
+  info = usersdb[username]
+  _state_counts[info.state] -= 1
+  _submitted_players -= _has_submitted(info)
+  if state is not None:
+    info.state = state
+  if text is not None:
+    info.text = text
+    info.has_text = bool(text) and not text.isspace()
+  _state_counts[info.state] += 1
+  _submitted_players += _has_submitted(info)
+  _refresh_status()
+  users_view[username] = {"state": _USER_STATE_VALUE[info.state], "text": info.text}
+  _players_json = None
+  return info
+
+
+def _start_round() -> None:
+  assert app_state.reader_order is not None
+  app_state.state = GameState.GAME_WAITING_FOR_DEFINITIONS
+  refresh_state_json()
+  # choose the next reader and move them to the back of the rotation
+  reader = app_state.reader_order[0]
+  app_state.reader_order.rotate(-1)
+
+  # Assign roles accordingly
+  for uname in usersdb:
+    if uname == reader:
+      update_user(uname, state=UserState.READER)
+    else:
+      update_user(uname, state=UserState.PLAYER)
+  bump_generation()
+
+
+def _start_first_round() -> None:
+  # now we do not accept any new user
+  app_state.reader_order = deque(usersdb)
+  _start_round()
+
+
+# what starting a round means in each state that waits for players
+_ROUND_STARTERS: Dict[GameState, Callable[[], None]] = {
+  GameState.WAITING_FOR_NEW_PLAYERS: _start_first_round,
+  GameState.WAITING_FOR_PLAYERS: _start_round,
+}
+
+
+def check_readiness() -> None:
+  """Start a round once enough users joined and all of them are ready.
+
+  Call with USERS_LOCK held for writing; STATE_LOCK is taken here.
+  """
+  total = len(usersdb)
+  necessary_players = total >= MINIMUM_PLAYERS
+  all_ready = total > 0 and users_in(UserState.READY) == total
 
   # If all are ready and we've reached the minimum players, mark the game started
-  if necessary_players and all_ready:
-    with STATE_LOCK:
-      if (
-        app_state.state is GameState.WAITING_FOR_PLAYERS
-        or app_state.state is GameState.WAITING_FOR_NEW_PLAYERS
-      ):
-        # now we do not accept any new user
-        if app_state.state is GameState.WAITING_FOR_NEW_PLAYERS:
-          with USERS_LOCK:
-            app_state.reader_order = list(usersdb.keys())
-            app_state.reader_idx = 0
-        app_state.state = GameState.GAME_WAITING_FOR_DEFINITIONS
-        assert app_state.reader_order is not None
-        assert app_state.reader_idx is not None
-        # choose the next reader based on the rotation index
-
-        idx = app_state.reader_idx % len(app_state.reader_order)
-        reader = app_state.reader_order[idx]
-        app_state.reader_idx = (idx + 1) % len(app_state.reader_order)
-
-        # Assign roles accordingly
-        with USERS_LOCK:
-          for uname, u in usersdb.items():
-            if uname == reader:
-              u.state = UserState.READER
-            else:
-              u.state = UserState.PLAYER
-
-
-def init():
+  if not (necessary_players and all_ready):
+    return
+  # unlocked pre-check (a single reference load) so that STATE_LOCK is only
+  # taken while a round can actually start; repeated under the lock below
+  if app_state.state not in _ROUND_STARTERS:
+    return
+  with STATE_LOCK.write():
+    start = _ROUND_STARTERS.get(app_state.state)
+    if start is not None:
+      start()
+
+
+def init() -> None:
   pass
 
 